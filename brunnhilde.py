@@ -10,7 +10,7 @@ A Siegfried-based digital archives reporting tool
 For information on usage and dependencies, see:
 github.com/tw4l/brunnhilde
 
-Python 2.7 & 3.4+
+Python 3.5+
 
 The MIT License (MIT)
 Copyright (c) 2017 Tim Walsh
@@ -18,12 +18,18 @@ http://bitarchivist.net
 
 """
 import argparse
-from collections import OrderedDict
+import atexit
+import concurrent.futures
+import contextlib
 import csv
 import datetime
 import errno
-from itertools import islice
+import functools
+from html import escape
+from itertools import chain, groupby, islice
+import logging
 import math
+from operator import itemgetter
 import os
 import re
 import requests
@@ -31,11 +37,72 @@ import shutil
 import sqlite3
 import subprocess
 import sys
-
-def run_siegfried(args, source_dir, use_hash):
+import tempfile
+import threading
+
+try:
+    import pyarrow
+    import pyarrow.csv
+except ImportError: # optional, used for faster csv parsing when installed
+    pyarrow = None
+
+log = logging.getLogger('brunnhilde')
+IS_WINDOWS = sys.platform.startswith('win') # clamav, bulk extractor, tree, and disk images are skipped on Windows
+open_text = functools.partial(open, encoding='utf8', newline='') # text files and csvs, same on every platform
+
+DB_BATCH_SIZE = 10000 # rows per batch when loading csv into or exporting csv from sqlite
+INSERT_HASH = "INSERT INTO siegfried VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+INSERT_NOHASH = "INSERT INTO siegfried VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+SHM_DIR = '/dev/shm' # memory-backed tmpfs on linux, used for carved files that are deleted after processing
+HTML_BUFFER_SIZE = 1024 * 1024 # write buffer for html report
+HTML_ROW_BATCH_SIZE = 8192 # table rows per writelines call
+PRONOM_RE = re.compile(r"x-fmt/[0-9]+|fmt/[0-9]+") # matches fmt/# or x-fmt/# PUIDs
+PRONOM_LINK = r'<a href="http://nationalarchives.gov.uk/PRONOM/\g<0>" target="_blank">\g<0></a>'
+
+class Context(object):
+    """Input and output paths for a Brunnhilde run, plus the Siegfried command used"""
+    __slots__ = ('source', 'basename', 'report_dir', 'csv_dir', 'log_dir', 'bulkext_dir', 'sf_file', 'sf_command')
+
+    def __init__(self, source, destination, basename):
+        self.source = source
+        self.basename = basename
+        self.report_dir = os.path.join(destination, '%s' % basename)
+        self.csv_dir = os.path.join(self.report_dir, 'csv_reports')
+        self.log_dir = os.path.join(self.report_dir, 'logs')
+        self.bulkext_dir = os.path.join(self.report_dir, 'bulk_extractor')
+        self.sf_file = os.path.join(self.report_dir, 'siegfried.csv')
+        self.sf_command = ''
+
+class PronomLinkWriter(object):
+    """Html report file that links fmt/# and x-fmt/# PUIDs to their PRONOM page as it is written
+
+    Every write holds whole table cells, so no PUID is split across calls.
+    """
+    __slots__ = ('_file',)
+
+    def __init__(self, path):
+        self._file = open_text(path, 'w', buffering=HTML_BUFFER_SIZE)
+
+    def write(self, text):
+        return self._file.write(PRONOM_RE.sub(PRONOM_LINK, text))
+
+    def writelines(self, lines):
+        self._file.writelines(PRONOM_RE.sub(PRONOM_LINK, line) for line in lines)
+
+    def close(self):
+        self._file.close()
+
+def run_siegfried(args, ctx, source_dir, use_hash):
     """Run siegfried on directory"""
-    print("\nRunning Siegfried against %s. This may take some time." % source_dir)
-    global sf_command
+    log.info("\nRunning Siegfried against %s. This may take some time.", source_dir)
+    sf_args = ['sf']
+    if args.scanarchives == True:
+        sf_args.append('-z')
+    sf_args.append('-csv')
+    if args.throttle == True:
+        sf_args.extend(['-throttle', '10ms'])
+    if args.verbosesf == True:
+        sf_args.extend(['-log', 'p,t'])
     if use_hash == True:
         hash_type = 'md5'
         if args.hash == 'sha1':
@@ -44,53 +111,90 @@ def run_siegfried(args, source_dir, use_hash):
             hash_type = 'sha256'
         elif args.hash == 'sha512':
             hash_type = 'sha512'
-        sf_command = 'sf -csv -hash %s "%s" > "%s"' % (hash_type, source_dir, sf_file)
-    else:
-        sf_command = 'sf -csv "%s" > "%s"' % (source_dir, sf_file)
-    if args.scanarchives == True:
-        sf_command = sf_command.replace('sf -csv', 'sf -z -csv')
-    if args.throttle == True:
-        sf_command = sf_command.replace('-csv -hash', '-csv -throttle 10ms -hash')
-    if args.verbosesf == True:
-        sf_command = sf_command.replace(' -hash', ' -log p,t -hash')
-    subprocess.call(sf_command, shell=True)
-    print("\nSiegfried scan complete. Processing results.")
-    return sf_command
-
-def run_clamav(args, source_dir):
+        sf_args.extend(['-hash', hash_type])
+    sf_args.append(source_dir)
+    # command string is only kept for display in the html report
+    ctx.sf_command = '%s "%s" > "%s"' % (' '.join(sf_args[:-1]), source_dir, ctx.sf_file)
+    with open(ctx.sf_file, 'wb') as sf_out:
+        subprocess.run(sf_args, stdout=sf_out, close_fds=False, check=False)
+    log.info("\nSiegfried scan complete. Processing results.")
+    return ctx.sf_command
+
+def tee_command(cmd, log_path, on_line=None):
+    """Run command, echoing its stdout to the terminal and to log_path
+
+    If given, on_line is called with each line of output (as bytes) as it arrives.
+    """
+    stdout = sys.stdout.buffer
+    with open(log_path, 'wb') as log_file:
+        try:
+            p = subprocess.Popen(cmd, stdout=subprocess.PIPE, close_fds=False)
+        except OSError as e:
+            log.error("\nERROR: Unable to run %s. Detailed output: %s", cmd[0], e)
+            return
+        for line in iter(p.stdout.readline, b''):
+            stdout.write(line)
+            stdout.flush()
+            log_file.write(line)
+            if on_line is not None:
+                on_line(line)
+        p.stdout.close()
+        p.wait()
+
+def run_clamav(args, ctx, source_dir):
     """Run ClamAV on directory"""
     timestamp = str(datetime.datetime.now())
-    print("\nRunning virus check on %s. This may take a few minutes." % source_dir)
-    virus_log = os.path.join(log_dir, 'viruscheck-log.txt')
+    log.info("\nRunning virus check on %s. This may take a few minutes.", source_dir)
+    virus_log = os.path.join(ctx.log_dir, 'viruscheck-log.txt')
+    clamav_args = ['clamscan', '-i', '-r', source_dir]
     if args.largefiles == True:
-        clamav_command = 'clamscan -i -r "%s" --max-scansize=0 --max-filesize=0 | tee "%s"' % (source_dir, virus_log)
-    else:
-        clamav_command = 'clamscan -i -r "%s" | tee "%s"' % (source_dir, virus_log)
-    subprocess.call(clamav_command, shell=True)
+        clamav_args.extend(['--max-scansize=0', '--max-filesize=0'])
+    # check for infected files as output streams past, from the summary clamscan prints at the end
+    scan_summary = {}
+    def check_summary(line):
+        if line.startswith(b'Infected files:'):
+            scan_summary['infected'] = line.split(b':', 1)[1].strip() != b'0'
+    tee_command(clamav_args, virus_log, check_summary)
     # add timestamp
     target = open(virus_log, 'a')
     target.write("Date scanned: %s" % timestamp)
     target.close()
-    # check log for infected files
-    if os.path.getsize(virus_log) > 40: # check to see if clamscan actually ran
-        if "Infected files: 0" not in open(virus_log).read():
-            print("\nWARNING: Infected file(s) found in %s. See %s for details." % (source_dir, virus_log))
-        else:
-            print("\nNo infections found in %s." % source_dir)
+    if 'infected' not in scan_summary: # clamscan didn't run to completion
+        log.error("\nClamAV not properly configured.")
+    elif scan_summary['infected']:
+        log.warning("\nWARNING: Infected file(s) found in %s. See %s for details.", source_dir, virus_log)
     else:
-        print("\nClamAV not properly configured.")
+        log.info("\nNo infections found in %s.", source_dir)
 
-def run_bulkext(source_dir, ssn_mode):
+def run_bulkext(ctx, source_dir, ssn_mode):
     """Run bulk extractor on directory"""
-    bulkext_log = os.path.join(log_dir, 'bulkext-log.txt')
-    print("\nRunning Bulk Extractor on %s. This may take a few minutes." % source_dir)
+    bulkext_log = os.path.join(ctx.log_dir, 'bulkext-log.txt')
+    log.info("\nRunning Bulk Extractor on %s. This may take a few minutes.", source_dir)
     try:
-        os.makedirs(bulkext_dir)
+        os.makedirs(ctx.bulkext_dir)
     except OSError as exception:
         if exception.errno != errno.EEXIST:
             raise
-    bulkext_command = 'bulk_extractor -S ssn_mode=%d -o "%s" -R "%s" | tee "%s"' % (ssn_mode, bulkext_dir, source_dir, bulkext_log)
-    subprocess.call(bulkext_command, shell=True)
+    bulkext_args = ['bulk_extractor', '-S', 'ssn_mode=%d' % ssn_mode, '-o', ctx.bulkext_dir, '-R', source_dir]
+    tee_command(bulkext_args, bulkext_log)
+
+def cpu_has_sha_extensions():
+    """Check whether the CPU advertises SHA hardware instructions (x86 SHA-NI)"""
+    if sys.platform.startswith('linux'):
+        try:
+            with open('/proc/cpuinfo') as f:
+                for line in f:
+                    if line.startswith('flags'):
+                        return 'sha_ni' in line.split()
+        except OSError:
+            pass
+    elif sys.platform.startswith('darwin'):
+        try:
+            features = subprocess.check_output(['sysctl', '-n', 'machdep.cpu.leaf7_features'], stderr=subprocess.STDOUT).decode()
+            return 'SHA' in features.split()
+        except (subprocess.CalledProcessError, OSError):
+            pass
+    return False
 
 def convert_size(size):
     # convert size to human-readable form
@@ -104,503 +208,575 @@ def convert_size(size):
     s = s.replace('.0', '')
     return '%s %s' % (s,size_name[i])
 
-def import_csv(cursor, conn, use_hash):
-    """Import csv file into sqlite db"""
-    if (sys.version_info > (3, 0)):
-        f = open(sf_file, 'r', encoding='utf8')
-    else:
-        f = open(sf_file, 'rb')
+def strip_null_bytes(in_path, out_path):
+    """Copy in_path to out_path in binary chunks, dropping null bytes"""
+    with open(in_path, 'rb') as in_file:
+        with open(out_path, 'wb') as out_file:
+            for chunk in iter(lambda: in_file.read(1024 * 1024), b''):
+                out_file.write(chunk.replace(b'\0', b''))
+
+@contextlib.contextmanager
+def null_stripped_copy(path):
+    """Yield path of a null-byte-free copy of path, removed again on exit"""
+    clean_path = path + '.clean'
+    strip_null_bytes(path, clean_path)
     try:
-        reader = csv.reader(x.replace('\0', '') for x in f) # replace null bytes with empty strings on read
-    except UnicodeDecodeError:
-        f = (x.encode('utf-8').strip() for x in f) # skip non-utf8 encodable characters
-        reader = csv.reader(x.replace('\0', '') for x in f) # replace null bytes with empty strings on read
-    header = True
-    for row in reader:
-        if header:
-            header = False # gather column names from first row of csv
-            sql = "DROP TABLE IF EXISTS siegfried"
-            cursor.execute(sql)
-            if use_hash == True:
-                sql = "CREATE TABLE siegfried (filename text, filesize text, modified text, errors text, hash text, namespace text, id text, format text, version text, mime text, basis text, warning text)"
-            else:
-                sql = "CREATE TABLE siegfried (filename text, filesize text, modified text, errors text, namespace text, id text, format text, version text, mime text, basis text, warning text)"
-            cursor.execute(sql)
-            insertsql = "INSERT INTO siegfried VALUES (%s)" % (", ".join([ "?" for column in row ]))
-            rowlen = len(row)
-        else:
+        yield clean_path
+    finally:
+        os.remove(clean_path)
+
+def read_csv_header(path):
+    """Return list of column names from first row of csv file"""
+    with open_text(path) as f:
+        return next(csv.reader(f), [])
+
+def insert_batches(cursor, sql, rows):
+    """Insert rows with sql in fixed-size batches to keep memory flat on very large scans"""
+    while True:
+        batch = list(islice(rows, DB_BATCH_SIZE))
+        if not batch:
+            break
+        cursor.executemany(sql, batch)
+
+def hex_to_blob(value):
+    """Convert hex digest to raw bytes, leaving values that aren't valid hex unchanged"""
+    try:
+        return bytes.fromhex(value)
+    except (TypeError, ValueError):
+        return value
+
+def load_csv_vtab(cursor, sf_file, use_hash):
+    """Load siegfried csv into db with SQLite's csv virtual table extension
+
+    Returns False without touching the db if the extension can't be loaded.
+    """
+    try:
+        cursor.connection.enable_load_extension(True)
+        cursor.connection.load_extension('csv')
+    except (AttributeError, sqlite3.OperationalError):
+        return False
+    finally:
+        try:
+            cursor.connection.enable_load_extension(False)
+        except (AttributeError, sqlite3.OperationalError):
+            pass
+    num_columns = len(cursor.execute("PRAGMA table_info(siegfried)").fetchall())
+    with null_stripped_copy(sf_file) as clean_file:
+        if len(read_csv_header(clean_file)) != num_columns:
+            return False
+        # one column more than the header, so rows with extra fields can be spotted;
+        # the csv vtab fills missing fields with NULL and empty fields with ''
+        cursor.execute("CREATE VIRTUAL TABLE temp.sf_csv USING csv(filename='%s', header=YES, columns=%d)"
+            % (clean_file.replace("'", "''"), num_columns + 1))
+        try:
+            vtab_columns = ['"%s"' % column[1].replace('"', '""') for column in cursor.execute("PRAGMA temp.table_info(sf_csv)")]
+            if len(vtab_columns) != num_columns + 1:
+                return False
             # skip lines that don't have right number of columns
-            if len(row) == rowlen:
-                cursor.execute(insertsql, row)
-    conn.commit()
+            cursor.execute("INSERT INTO siegfried SELECT %s FROM temp.sf_csv WHERE %s IS NOT NULL AND %s IS NULL"
+                % (', '.join(vtab_columns[:num_columns]), vtab_columns[num_columns - 1], vtab_columns[num_columns]))
+        finally:
+            cursor.execute("DROP TABLE temp.sf_csv")
+    if use_hash == True:
+        # store hashes as raw bytes; unhex() is built in from sqlite 3.41
+        if sqlite3.sqlite_version_info < (3, 41, 0):
+            cursor.connection.create_function('unhex', 1, hex_to_blob)
+        cursor.execute("UPDATE siegfried SET hash = COALESCE(unhex(hash), hash)")
+    return True
+
+def load_csv_arrow(cursor, sf_file, use_hash):
+    """Load siegfried csv into db by parsing it with pyarrow
+
+    Returns False, leaving the table empty, if pyarrow isn't installed or can't parse the file.
+    """
+    if pyarrow is None:
+        return False
+    columns = [column[1] for column in cursor.execute("PRAGMA table_info(siegfried)")]
+    if use_hash == True:
+        insertsql = INSERT_HASH
+    else:
+        insertsql = INSERT_NOHASH
+
+    def batch_rows(batch):
+        values = [column.to_pylist() for column in batch.columns]
+        if use_hash == True:
+            # store hashes as raw bytes
+            values[4] = [hex_to_blob(value) for value in values[4]]
+        return zip(*values)
+
+    with null_stripped_copy(sf_file) as clean_file:
+        # every row would be skipped as invalid if the header doesn't match the table
+        if len(read_csv_header(clean_file)) != len(columns):
+            return False
+        try:
+            # stream the csv one record batch at a time rather than reading it all into memory
+            with pyarrow.csv.open_csv(clean_file,
+                    read_options=pyarrow.csv.ReadOptions(column_names=columns, skip_rows=1),
+                    # skip lines that don't have right number of columns
+                    parse_options=pyarrow.csv.ParseOptions(newlines_in_values=True, invalid_row_handler=lambda row: 'skip'),
+                    # keep every value as the string siegfried wrote, with empty strings rather than nulls
+                    convert_options=pyarrow.csv.ConvertOptions(column_types=dict((column, pyarrow.string()) for column in columns))) as reader:
+                insert_batches(cursor, insertsql, chain.from_iterable(batch_rows(batch) for batch in reader))
+        except pyarrow.ArrowInvalid:
+            # leave the db as it was for the next loader
+            cursor.execute("DELETE FROM siegfried")
+            return False
+    return True
+
+def load_csv_python(cursor, sf_file, use_hash):
+    """Load siegfried csv into db by parsing it with the csv module"""
+    f = open_text(sf_file)
+    reader = csv.reader(x.replace('\0', '') for x in f) # replace null bytes with empty strings on read
+    header = next(reader, []) # gather column names from first row of csv
+    rowlen = len(header)
+    # skip lines that don't have right number of columns
+    rows = (row for row in reader if len(row) == rowlen)
+    if use_hash == True:
+        insertsql = INSERT_HASH
+        # store hashes as raw bytes
+        rows = (row[:4] + [hex_to_blob(row[4])] + row[5:] for row in rows)
+    else:
+        insertsql = INSERT_NOHASH
+    insert_batches(cursor, insertsql, rows)
     f.close()
 
-def get_stats(args, source_dir, scan_started, cursor, html, brunnhilde_version, siegfried_version, use_hash):
+def create_table(cursor, use_hash):
+    """Create empty siegfried table, replacing any existing one"""
+    sql = "DROP TABLE IF EXISTS siegfried"
+    cursor.execute(sql)
+    if use_hash == True:
+        sql = "CREATE TABLE siegfried (filename text, filesize text, modified text, errors text, hash blob, namespace text, id text, format text, version text, mime text, basis text, warning text)"
+    else:
+        sql = "CREATE TABLE siegfried (filename text, filesize text, modified text, errors text, namespace text, id text, format text, version text, mime text, basis text, warning text)"
+    cursor.execute(sql)
+
+def import_csv(cursor, conn, sf_file, use_hash):
+    """Import csv file into sqlite db"""
+    # load and index in a single transaction, committed once at the end
+    with conn:
+        create_table(cursor, use_hash)
+        # parse and insert inside sqlite when possible, then pyarrow, else fall back to python
+        if not load_csv_vtab(cursor, sf_file, use_hash):
+            if not load_csv_arrow(cursor, sf_file, use_hash):
+                load_csv_python(cursor, sf_file, use_hash)
+        # index the columns report queries filter and group on
+        index_columns = ['filesize', 'id', 'warning', 'errors']
+        if use_hash == True:
+            index_columns.insert(0, 'hash')
+        for column in index_columns:
+            cursor.execute("CREATE INDEX idx_%s ON siegfried(%s)" % (column, column))
+
+def get_stats(args, ctx, scan_started, cursor, html, brunnhilde_version, siegfried_version, use_hash):
     """Get aggregate statistics and write to html report"""
     
-    # get stats from sqlite db
-    cursor.execute("SELECT COUNT(*) from siegfried;") # total files
-    num_files = cursor.fetchone()[0]
-
-    cursor.execute("SELECT COUNT(*) from siegfried where filesize='0';") # empty files
-    empty_files = cursor.fetchone()[0]
+    # with -z siegfried also lists archive members (archive.zip#member), which are
+    # already counted in the archive's own size, so leave them out of the total size;
+    # a '#' only marks a member when the name before it is itself a scanned file
+    if args.scanarchives == True:
+        size_sql = """CASE WHEN instr(filename, '#') = 0
+            OR substr(filename, 1, instr(filename, '#') - 1) NOT IN (SELECT filename FROM siegfried)
+            THEN CAST(filesize AS INTEGER) END"""
+    else:
+        size_sql = "CAST(filesize AS INTEGER)"
+
+    # get stats from sqlite db in a single pass over the table
+    cursor.execute("""SELECT COUNT(*),
+        COALESCE(SUM(filesize='0'), 0),
+        COALESCE(SUM(id='UNKNOWN'), 0),
+        COUNT(DISTINCT CASE WHEN format <> '' THEN format END),
+        COALESCE(SUM(errors <> ''), 0),
+        COALESCE(SUM(warning <> ''), 0),
+        COALESCE(SUM(%s), 0)
+        FROM siegfried;""" % size_sql)
+    # total files, empty files, unidentified files, number of identified file formats,
+    # number of siegfried errors and warnings, total size of files on disk
+    (num_files, empty_files, unidentified_files, num_formats,
+        num_errors, num_warnings, size_bytes) = cursor.fetchone()
 
     if use_hash == True:
-        cursor.execute("SELECT COUNT(DISTINCT hash) from siegfried WHERE filesize<>'0';") # distinct files
-        distinct_files = cursor.fetchone()[0]
-    
-        cursor.execute("SELECT COUNT(hash) FROM siegfried t1 WHERE EXISTS (SELECT 1 from siegfried t2 WHERE t2.hash = t1.hash AND t1.filename != t2.filename) AND filesize<>'0'") # duplicates
-        all_dupes = cursor.fetchone()[0]
-
-        cursor.execute("SELECT COUNT(DISTINCT hash) FROM siegfried t1 WHERE EXISTS (SELECT 1 from siegfried t2 WHERE t2.hash = t1.hash AND t1.filename != t2.filename) AND filesize<>'0'") # distinct duplicates
-        distinct_dupes = cursor.fetchone()[0]
+        # group non-empty files by hash once to get distinct files, distinct files
+        # with duplicates, and all files that share a hash with another file
+        cursor.execute("""SELECT COUNT(*),
+            COALESCE(SUM(num > 1), 0),
+            COALESCE(SUM(CASE WHEN num > 1 THEN num END), 0)
+            FROM (SELECT COUNT(*) AS num FROM siegfried WHERE filesize<>'0' GROUP BY hash);""")
+        distinct_files, distinct_dupes, all_dupes = cursor.fetchone()
 
         duplicate_copies = int(all_dupes) - int(distinct_dupes) # number of duplicate copies of unique files
         duplicate_copies = str(duplicate_copies)
 
-    cursor.execute("SELECT COUNT(*) FROM siegfried WHERE id='UNKNOWN';") # unidentified files
-    unidentified_files = cursor.fetchone()[0]
-
-    year_sql = "SELECT DISTINCT SUBSTR(modified, 1, 4) as 'year' FROM siegfried;" # min and max year
-    year_path = os.path.join(csv_dir, 'uniqueyears.csv')
-    # if python3, specify newline to prevent extra csv line in windows
-    # else, open and read csv in bytes mode
-    # see: https://stackoverflow.com/questions/3348460/csv-file-written-with-python-has-blank-lines-between-each-row
-    if (sys.version_info > (3, 0)):
-        year_report = open(year_path, 'w', newline='')
-    else:
-        year_report = open(year_path, 'wb')
-    w = csv.writer(year_report)
-    for row in cursor.execute(year_sql):
-        w.writerow(row)
-    year_report.close()
-
-    if (sys.version_info > (3, 0)):
-        year_report_read = open(year_path, 'r', newline='')
-    else:
-        year_report_read = open(year_path, 'rb')
-    r = csv.reader(year_report_read)
-    years = []
-    for row in r:
-        if row:
-            years.append(row[0])
-    if not years:
-        begin_date = "N/A"
-        end_date = "N/A"  
-    else:
-        begin_date = min(years, key=float)
-        end_date = max(years, key=float)
-    year_report_read.close()
-
-    # delete temporary uniqueyear file from csv reports dir
-    os.remove(year_path)
-
-    datemodified_sql = "SELECT DISTINCT modified FROM siegfried;" # min and max full modified date
-    datemodified_path = os.path.join(csv_dir, 'datemodified.csv')
-    # specify newline in python3 to prevent extra csv lines in windows
-    # read and write csv in byte mode in python2
-    if (sys.version_info > (3, 0)):
-        date_report = open(datemodified_path, 'w', newline='')
-    else:
-        date_report = open(datemodified_path, 'wb')
-    w = csv.writer(date_report)
-    for row in cursor.execute(datemodified_sql):
-        w.writerow(row)
-    date_report.close()
-
-    if (sys.version_info > (3, 0)):
-        date_report_read = open(datemodified_path, 'r', newline='')
-    else:
-        date_report_read = open(datemodified_path, 'rb')
-    r = csv.reader(date_report_read)
-    dates = []
-    for row in r:
-        if row:
-            dates.append(row[0])
-    if not dates:
-        earliest_date = "N/A"
-        latest_date = "N/A"
-    else:
-        earliest_date = min(dates)
-        latest_date = max(dates)
-    date_report_read.close()
-
-    os.remove(datemodified_path) # delete temporary datemodified file from csv reports dir
-
-    cursor.execute("SELECT COUNT(DISTINCT format) as formats from siegfried WHERE format <> '';") # number of identfied file formats
-    num_formats = cursor.fetchone()[0]
+    # min and max year and full modified date
+    # years are only taken from dates starting with four digits, so they compare as numbers;
+    # ISO 8601 dates sort chronologically as plain strings
+    cursor.execute("""SELECT MIN(year), MAX(year), MIN(modified), MAX(modified)
+        FROM (SELECT modified, CASE WHEN modified GLOB '[0-9][0-9][0-9][0-9]*' THEN SUBSTR(modified, 1, 4) END AS year
+            FROM siegfried WHERE modified <> '');""")
+    begin_date, end_date, earliest_date, latest_date = [value or "N/A" for value in cursor.fetchone()]
 
-    cursor.execute("SELECT COUNT(*) FROM siegfried WHERE errors <> '';") # number of siegfried errors
-    num_errors = cursor.fetchone()[0]
-
-    cursor.execute("SELECT COUNT(*) FROM siegfried WHERE warning <> '';") # number of siegfried warnings
-    num_warnings = cursor.fetchone()[0]
-
-    # calculate size from recursive dirwalk and format
-    size_bytes = 0
-    if (sys.version_info > (3, 0)):
-        for root, dirs, files in os.walk(source_dir):
-            for f in files:
-                file_path = os.path.join(root, f)
-                file_info = os.stat(file_path)
-                size_bytes += file_info.st_size
-    else:
-        for root, dirs, files in os.walk(unicode(source_dir, 'utf-8')):
-            for f in files:
-                file_path = os.path.join(root, f)
-                try:
-                    file_info = os.stat(file_path)
-                    size_bytes += file_info.st_size
-                except OSError as e: # report when Brunnhilde can't find file
-                    print("\nOSError: %s. File size of this file not included in Brunnhilde HTML report statistics." % (e))
     size = convert_size(size_bytes)
 
-    # write html
-    html.write('<!DOCTYPE html>')
-    html.write('\n<html lang="en">')
-    html.write('\n<head>')
-    html.write('\n<title>Brunnhilde report: %s</title>' % basename)
-    html.write('\n<meta http-equiv="Content-Type" content="text/html; charset=utf-8">')
-    html.write('\n<link rel="stylesheet" href="./.assets/css/bootstrap.min.css">')
-    html.write('\n</head>')
-    html.write('\n<body style="padding-top: 80px">')
+    # build html in memory and write it in one call
+    html_parts = []
+    html_parts.append('<!DOCTYPE html>')
+    html_parts.append('\n<html lang="en">')
+    html_parts.append('\n<head>')
+    html_parts.append('\n<title>Brunnhilde report: %s</title>' % escape(ctx.basename, False))
+    html_parts.append('\n<meta http-equiv="Content-Type" content="text/html; charset=utf-8">')
+    html_parts.append('\n<link rel="stylesheet" href="./.assets/css/bootstrap.min.css">')
+    html_parts.append('\n</head>')
+    html_parts.append('\n<body style="padding-top: 80px">')
     # navbar
-    html.write('\n<nav class="navbar navbar-expand-lg navbar-dark bg-dark fixed-top">')
-    html.write('\n<a class="navbar-brand" href="#">Brunnhilde</a>')
-    html.write('\n<button class="navbar-toggler" type="button" data-toggle="collapse" data-target="#navbarNavAltMarkup" aria-controls="navbarNavAltMarkup" aria-expanded="false" aria-label="Toggle navigation">')
-    html.write('\n<span class="navbar-toggler-icon"></span>')
-    html.write('\n</button>')
-    html.write('\n<div class="collapse navbar-collapse" id="navbarNavAltMarkup">')
-    html.write('\n<div class="navbar-nav">')
-    html.write('\n<a class="nav-item nav-link" href="#Provenance">Provenance</a>')
-    html.write('\n<a class="nav-item nav-link" href="#Stats">Statistics</a>')
-    html.write('\n<a class="nav-item nav-link" href="#File formats">File formats</a>')
-    html.write('\n<a class="nav-item nav-link" href="#File format versions">Versions</a>')
-    html.write('\n<a class="nav-item nav-link" href="#MIME types">MIME types</a>')
-    html.write('\n<a class="nav-item nav-link" href="#Last modified dates by year">Dates</a>')
-    html.write('\n<a class="nav-item nav-link" href="#Unidentified">Unidentified</a>')
+    html_parts.append('\n<nav class="navbar navbar-expand-lg navbar-dark bg-dark fixed-top">')
+    html_parts.append('\n<a class="navbar-brand" href="#">Brunnhilde</a>')
+    html_parts.append('\n<button class="navbar-toggler" type="button" data-toggle="collapse" data-target="#navbarNavAltMarkup" aria-controls="navbarNavAltMarkup" aria-expanded="false" aria-label="Toggle navigation">')
+    html_parts.append('\n<span class="navbar-toggler-icon"></span>')
+    html_parts.append('\n</button>')
+    html_parts.append('\n<div class="collapse navbar-collapse" id="navbarNavAltMarkup">')
+    html_parts.append('\n<div class="navbar-nav">')
+    html_parts.append('\n<a class="nav-item nav-link" href="#Provenance">Provenance</a>')
+    html_parts.append('\n<a class="nav-item nav-link" href="#Stats">Statistics</a>')
+    html_parts.append('\n<a class="nav-item nav-link" href="#File formats">File formats</a>')
+    html_parts.append('\n<a class="nav-item nav-link" href="#File format versions">Versions</a>')
+    html_parts.append('\n<a class="nav-item nav-link" href="#MIME types">MIME types</a>')
+    html_parts.append('\n<a class="nav-item nav-link" href="#Last modified dates by year">Dates</a>')
+    html_parts.append('\n<a class="nav-item nav-link" href="#Unidentified">Unidentified</a>')
     if args.showwarnings == True:
-        html.write('\n<a class="nav-item nav-link" href="#Warnings">Warnings</a>')
-    html.write('\n<a class="nav-item nav-link" href="#Errors">Errors</a>')
+        html_parts.append('\n<a class="nav-item nav-link" href="#Warnings">Warnings</a>')
+    html_parts.append('\n<a class="nav-item nav-link" href="#Errors">Errors</a>')
     if use_hash == True:
-        html.write('\n<a class="nav-item nav-link" href="#Duplicates">Duplicates</a>')
+        html_parts.append('\n<a class="nav-item nav-link" href="#Duplicates">Duplicates</a>')
     if args.bulkextractor == True:
-        html.write('\n<a class="nav-item nav-link" href="#SSNs">SSNs</a>')
-    html.write('\n</div>')
-    html.write('\n</div>')
-    html.write('\n</nav>')
+        html_parts.append('\n<a class="nav-item nav-link" href="#SSNs">SSNs</a>')
+    html_parts.append('\n</div>')
+    html_parts.append('\n</div>')
+    html_parts.append('\n</nav>')
     # content
-    html.write('\n<div class="container-fluid">')
-    html.write('\n<h1 style="text-align: center; margin-bottom: 40px;">Brunnhilde HTML report</h1>')
+    html_parts.append('\n<div class="container-fluid">')
+    html_parts.append('\n<h1 style="text-align: center; margin-bottom: 40px;">Brunnhilde HTML report</h1>')
     # provenance
-    html.write('\n<a name="Provenance" style="padding-top: 40px;"></a>')
-    html.write('\n<div class="container-fluid" style="margin-bottom: 40px;">')
-    html.write('\n<div class="card">')
-    html.write('\n<h2 class="card-header">Provenance</h2>')
-    html.write('\n<div class="card-body">')
-    html.write('\n<p><strong>Input source (directory or disk image):</strong> %s</p>' % source)
-    html.write('\n<p><strong>Accession/identifier:</strong> %s</p>' % basename)
-    html.write('\n<p><strong>Brunnhilde version:</strong> %s</p>' % brunnhilde_version)
-    html.write('\n<p><strong>Siegfried version:</strong> %s</p>' % siegfried_version)
-    html.write('\n<p><strong>Siegfried command:</strong> %s</p>' % sf_command)
-    html.write('\n<p><strong>Scan started:</strong> %s</p>' % scan_started)
-    html.write('\n</div>')
-    html.write('\n</div>')
-    html.write('\n</div>')
+    html_parts.append('\n<a name="Provenance" style="padding-top: 40px;"></a>')
+    html_parts.append('\n<div class="container-fluid" style="margin-bottom: 40px;">')
+    html_parts.append('\n<div class="card">')
+    html_parts.append('\n<h2 class="card-header">Provenance</h2>')
+    html_parts.append('\n<div class="card-body">')
+    html_parts.append('\n<p><strong>Input source (directory or disk image):</strong> %s</p>' % escape(ctx.source, False))
+    html_parts.append('\n<p><strong>Accession/identifier:</strong> %s</p>' % escape(ctx.basename, False))
+    html_parts.append('\n<p><strong>Brunnhilde version:</strong> %s</p>' % brunnhilde_version)
+    html_parts.append('\n<p><strong>Siegfried version:</strong> %s</p>' % siegfried_version)
+    html_parts.append('\n<p><strong>Siegfried command:</strong> %s</p>' % escape(ctx.sf_command, False))
+    html_parts.append('\n<p><strong>Scan started:</strong> %s</p>' % scan_started)
+    html_parts.append('\n</div>')
+    html_parts.append('\n</div>')
+    html_parts.append('\n</div>')
     # statistics
-    html.write('\n<a name="Stats" style="padding-top: 40px;"></a>')
-    html.write('\n<div class="container-fluid" style="margin-bottom: 40px;">')
-    html.write('\n<div class="card">')
-    html.write('\n<h2 class="card-header">Statistics</h2>')
-    html.write('\n<div class="card-body">')
-    html.write('\n<h4>Overview</h4>')
-    html.write('\n<p><strong>Total files:</strong> %s</p>' % num_files)
-    html.write('\n<p><strong>Total size:</strong> %s</p>' % size)
-    html.write('\n<p><strong>Years (last modified):</strong> %s - %s</p>' % (begin_date, end_date))
-    html.write('\n<p><strong>Earliest date:</strong> %s</p>' % earliest_date)
-    html.write('\n<p><strong>Latest date:</strong> %s</p>' % latest_date)
+    html_parts.append('\n<a name="Stats" style="padding-top: 40px;"></a>')
+    html_parts.append('\n<div class="container-fluid" style="margin-bottom: 40px;">')
+    html_parts.append('\n<div class="card">')
+    html_parts.append('\n<h2 class="card-header">Statistics</h2>')
+    html_parts.append('\n<div class="card-body">')
+    html_parts.append('\n<h4>Overview</h4>')
+    html_parts.append('\n<p><strong>Total files:</strong> %s</p>' % num_files)
+    html_parts.append('\n<p><strong>Total size:</strong> %s</p>' % size)
+    html_parts.append('\n<p><strong>Years (last modified):</strong> %s - %s</p>' % (begin_date, end_date))
+    html_parts.append('\n<p><strong>Earliest date:</strong> %s</p>' % earliest_date)
+    html_parts.append('\n<p><strong>Latest date:</strong> %s</p>' % latest_date)
     if use_hash == True:
-        html.write('\n<h4>File counts and contents</h4>')
-        html.write('\n<p><em>Calculated by hash value. Empty files are not counted in first three categories. Total files = distinct + duplicate + empty files.</em></p>')
-        html.write('\n<p><strong>Distinct files:</strong> %s</p>' % distinct_files)
-        html.write('\n<p><strong>Distinct files with duplicates:</strong> %s</p>' % distinct_dupes)
-        html.write('\n<p><strong>Duplicate files:</strong> %s</p>' % duplicate_copies)
+        html_parts.append('\n<h4>File counts and contents</h4>')
+        html_parts.append('\n<p><em>Calculated by hash value. Empty files are not counted in first three categories. Total files = distinct + duplicate + empty files.</em></p>')
+        html_parts.append('\n<p><strong>Distinct files:</strong> %s</p>' % distinct_files)
+        html_parts.append('\n<p><strong>Distinct files with duplicates:</strong> %s</p>' % distinct_dupes)
+        html_parts.append('\n<p><strong>Duplicate files:</strong> %s</p>' % duplicate_copies)
     else:
-        html.write('\n<h4>File contents</h4>')
-    html.write('\n<p><strong>Empty files:</strong> %s</p>' % empty_files)
-    html.write('\n<h4>Format identification</h4>')
-    html.write('\n<p><strong>Identified file formats:</strong> %s</p>' % num_formats)
-    html.write('\n<p><strong>Unidentified files:</strong> %s</p>' % unidentified_files)
-    html.write('\n<p><strong>Siegfried warnings:</strong> %s</p>' % num_warnings)
-    html.write('\n<h4>Errors</h4>')
-    html.write('\n<p><strong>Siegfried errors:</strong> %s</p>' % num_errors)
-    if (args.noclam is False) and (sys.platform.startswith('win') is False):
-        html.write('\n<h2>Virus scan report</h2>')
-        with open(os.path.join(log_dir, 'viruscheck-log.txt')) as f:
+        html_parts.append('\n<h4>File contents</h4>')
+    html_parts.append('\n<p><strong>Empty files:</strong> %s</p>' % empty_files)
+    html_parts.append('\n<h4>Format identification</h4>')
+    html_parts.append('\n<p><strong>Identified file formats:</strong> %s</p>' % num_formats)
+    html_parts.append('\n<p><strong>Unidentified files:</strong> %s</p>' % unidentified_files)
+    html_parts.append('\n<p><strong>Siegfried warnings:</strong> %s</p>' % num_warnings)
+    html_parts.append('\n<h4>Errors</h4>')
+    html_parts.append('\n<p><strong>Siegfried errors:</strong> %s</p>' % num_errors)
+    if (args.noclam is False) and (IS_WINDOWS is False):
+        html_parts.append('\n<h2>Virus scan report</h2>')
+        with open(os.path.join(ctx.log_dir, 'viruscheck-log.txt')) as f:
             virus_report = f.read()
-        html.write('\n<p>%s</p>' % virus_report)
-    html.write('\n</div>')
-    html.write('\n</div>')
-    html.write('\n</div>')
+        html_parts.append('\n<p>%s</p>' % escape(virus_report, False))
+    html_parts.append('\n</div>')
+    html_parts.append('\n</div>')
+    html_parts.append('\n</div>')
     # detailed reports
-    html.write('\n<div class="container-fluid" style="margin-bottom: 40px;">')
-    html.write('\n<div class="card">')
-    html.write('\n<h2 class="card-header">Detailed reports</h2>')
-    html.write('\n<div class="card-body">')
+    html_parts.append('\n<div class="container-fluid" style="margin-bottom: 40px;">')
+    html_parts.append('\n<div class="card">')
+    html_parts.append('\n<h2 class="card-header">Detailed reports</h2>')
+    html_parts.append('\n<div class="card-body">')
+    html.write(''.join(html_parts))
 
-def generate_reports(args, cursor, html, use_hash):
+def generate_reports(args, ctx, cursor, html, use_hash):
     """Run sql queries on db to generate reports, write to csv and html"""
     full_header = ['Filename', 'Filesize', 'Date modified', 'Errors', 'Checksum', 
                 'Namespace', 'ID', 'Format', 'Format version', 'MIME type', 
                 'Basis for ID', 'Warning']
+    # hashes are stored as raw bytes, so select them back out as lowercase hex
+    full_columns = ("filename, filesize, modified, errors, "
+                "CASE WHEN typeof(hash) = 'blob' THEN lower(hex(hash)) ELSE hash END, "
+                "namespace, id, format, version, mime, basis, warning")
     if use_hash == False:
         full_header = ['Filename', 'Filesize', 'Date modified', 'Errors', 'Namespace', 
                 'ID', 'Format', 'Format version', 'MIME type', 'Basis for ID', 'Warning']
+        full_columns = "*"
 
     # sorted format list report
     sql = "SELECT format, id, COUNT(*) as 'num' FROM siegfried GROUP BY format ORDER BY num DESC"
-    path = os.path.join(csv_dir, 'formats.csv')
+    path = os.path.join(ctx.csv_dir, 'formats.csv')
     format_header = ['Format', 'ID', 'Count']
     sqlite_to_csv(sql, path, format_header, cursor)
     write_html('File formats', path, ',', html)
 
     # sorted format and version list report
     sql = "SELECT format, id, version, COUNT(*) as 'num' FROM siegfried GROUP BY format, version ORDER BY num DESC"
-    path = os.path.join(csv_dir, 'formatVersions.csv')
+    path = os.path.join(ctx.csv_dir, 'formatVersions.csv')
     version_header = ['Format', 'ID', 'Version', 'Count']
     sqlite_to_csv(sql, path, version_header, cursor)
     write_html('File format versions', path, ',', html)
 
     # sorted mimetype list report
     sql = "SELECT mime, COUNT(*) as 'num' FROM siegfried GROUP BY mime ORDER BY num DESC"
-    path = os.path.join(csv_dir, 'mimetypes.csv')
+    path = os.path.join(ctx.csv_dir, 'mimetypes.csv')
     mime_header = ['MIME type', 'Count']
     sqlite_to_csv(sql, path, mime_header, cursor)
     write_html('MIME types', path, ',', html)
 
     # dates report
     sql = "SELECT SUBSTR(modified, 1, 4) as 'year', COUNT(*) as 'num' FROM siegfried GROUP BY year ORDER BY num DESC"
-    path = os.path.join(csv_dir, 'years.csv')
+    path = os.path.join(ctx.csv_dir, 'years.csv')
     year_header = ['Year Last Modified', 'Count']
     sqlite_to_csv(sql, path, year_header, cursor)
     write_html('Last modified dates by year', path, ',', html)
 
     # unidentified files report
-    sql = "SELECT * FROM siegfried WHERE id='UNKNOWN';"
-    path = os.path.join(csv_dir, 'unidentified.csv')
+    sql = "SELECT %s FROM siegfried WHERE id='UNKNOWN';" % full_columns
+    path = os.path.join(ctx.csv_dir, 'unidentified.csv')
     sqlite_to_csv(sql, path, full_header, cursor)
     write_html('Unidentified', path, ',', html)
     
     # warnings report
-    sql = "SELECT * FROM siegfried WHERE warning <> '';"
-    path = os.path.join(csv_dir, 'warnings.csv')
+    sql = "SELECT %s FROM siegfried WHERE warning <> '';" % full_columns
+    path = os.path.join(ctx.csv_dir, 'warnings.csv')
     sqlite_to_csv(sql, path, full_header, cursor)
     if args.showwarnings == True:
         write_html('Warnings', path, ',', html)
 
     # errors report
-    sql = "SELECT * FROM siegfried WHERE errors <> '';"
-    path = os.path.join(csv_dir, 'errors.csv')
+    sql = "SELECT %s FROM siegfried WHERE errors <> '';" % full_columns
+    path = os.path.join(ctx.csv_dir, 'errors.csv')
     sqlite_to_csv(sql, path, full_header, cursor)
     write_html('Errors', path, ',', html)
 
     if use_hash == True:
         # duplicates report
-        sql = "SELECT * FROM siegfried t1 WHERE EXISTS (SELECT 1 from siegfried t2 WHERE t2.hash = t1.hash AND t1.filename != t2.filename) AND filesize<>'0' ORDER BY hash;"
-        path = os.path.join(csv_dir, 'duplicates.csv')
+        sql = "SELECT %s FROM siegfried WHERE hash IN (SELECT hash FROM siegfried WHERE filesize<>'0' GROUP BY hash HAVING COUNT(*) > 1) AND filesize<>'0' ORDER BY hash;" % full_columns
+        path = os.path.join(ctx.csv_dir, 'duplicates.csv')
         sqlite_to_csv(sql, path, full_header, cursor)
         write_html('Duplicates', path, ',', html)
 
 def sqlite_to_csv(sql, path, header, cursor):
     """Write sql query result to csv"""
-    # in python3, specify newline to prevent extra csv lines in windows
-    # in python2, write csv in byte mode
-    if (sys.version_info > (3, 0)):
-        report = open(path, 'w', newline='', encoding='utf8')
-    else:
-        report = open(path, 'wb')
+    report = open_text(path, 'w')
     w = csv.writer(report)
     w.writerow(header)
-    for row in cursor.execute(sql):
-        w.writerow(row)
+    cursor.arraysize = DB_BATCH_SIZE
+    w.writerows(cursor.execute(sql))
     report.close()
 
 def write_html(header, path, file_delimiter, html):
     """Write csv file to html table"""
-    if (sys.version_info > (3, 0)):
-        in_file = open(path, 'r', encoding='utf8')
-    else:
-        in_file = open(path, 'rb')
-    # count lines and then return to start of file
-    numline = len(in_file.readlines())
-    in_file.seek(0)
-
+    in_file = open_text(path)
     #open csv reader
     r = csv.reader(in_file, delimiter="%s" % file_delimiter)
 
+    # read past header lines and peek at first data row, rather than counting lines
+    if header == 'SSNs':
+        header_rows = list(islice(r, 5))
+    else:
+        header_rows = list(islice(r, 1))
+    first_row = next(r, None)
+    rows = chain([first_row], r)
+
     # write header
-    html.write('\n<a name="%s" style="padding-top: 40px;"></a>' % header)
-    html.write('\n<h4>%s</h4>' % header)
+    html_parts = ['\n<a name="%s" style="padding-top: 40px;"></a>' % header, '\n<h4>%s</h4>' % header]
     if header == 'Duplicates':
-        html.write('\n<p><em>Duplicates are grouped by hash value.</em></p>')
+        html_parts.append('\n<p><em>Duplicates are grouped by hash value.</em></p>')
     elif header == 'SSNs':
-        html.write('\n<p><em>Potential Social Security Numbers identified by bulk_extractor.</em></p>')
+        html_parts.append('\n<p><em>Potential Social Security Numbers identified by bulk_extractor.</em></p>')
     
     # if writing PII, handle separately
     if header == 'SSNs':
-        if numline > 5: # aka more rows than just header
-            html.write('\n<table class="table table-sm table-responsive table-hover">')
-            #write header
-            html.write('\n<thead>')
-            html.write('\n<tr>')
-            html.write('\n<th>File</th>')
-            html.write('\n<th>Feature</th>')
-            html.write('\n<th>Context</th>')
-            html.write('\n</tr>')
-            html.write('\n</thead>')
+        if first_row is not None: # aka more rows than just header
+            html_parts.append('\n<table class="table table-sm table-responsive table-hover">'
+                '\n<thead>'
+                '\n<tr>'
+                '\n<th>File</th>'
+                '\n<th>Feature</th>'
+                '\n<th>Context</th>'
+                '\n</tr>'
+                '\n</thead>'
+                '\n<tbody>')
+            html.write(''.join(html_parts))
             # write data
-            html.write('\n<tbody>')
-            for row in islice(r, 4, None): # skip header lines
-                for row in r:
-                    # write data
-                    html.write('\n<tr>')
-                    for column in row:
-                        html.write('\n<td>' + column + '</td>')
-                    html.write('\n</tr>')
-            html.write('\n</tbody>')
-            html.write('\n</table>')
+            write_html_rows(rows, html)
+            html.write('\n</tbody>\n</table>')
         else:
-            html.write('\nNone found.')
+            html_parts.append('\nNone found.')
+            html.write(''.join(html_parts))
 
     # if writing duplicates, handle separately
     elif header == 'Duplicates':
-        if numline > 1: #aka more rows than just header
-            # read md5s from csv and write to list
-            hash_list = []
-            for row in r:
-                if row:
-                    hash_list.append(row[4])
-            # deduplicate md5_list
-            hash_list = list(OrderedDict.fromkeys(hash_list))
-            hash_list.remove('Checksum')
-            # for each hash in md5_list, print header, file info, and list of matching files
-            for hash_value in hash_list:
-                html.write('\n<p>Files matching checksum <strong>%s</strong>:</p>' % hash_value)
-                html.write('\n<table class="table table-sm table-responsive table-bordered table-hover">')
-                html.write('\n<thead>')
-                html.write('\n<tr>')
-                html.write('\n<th>Filename</th><th>Filesize</th>')
-                html.write('<th>Date modified</th><th>Errors</th>')
-                html.write('<th>Checksum</th><th>Namespace</th>')
-                html.write('<th>ID</th><th>Format</th>')
-                html.write('<th>Format version</th><th>MIME type</th>')
-                html.write('<th>Basis for ID</th><th>Warning</th>')
-                html.write('\n</tr>')
-                html.write('\n</thead>')
-                in_file.seek(0) # back to beginning of file
-                html.write('\n<tbody>')
-                for row in r:
-                    if row[4] == '%s' % hash_value:
-                        # write data
-                        html.write('\n<tr>')
-                        for column in row:
-                            html.write('\n<td>' + column + '</td>')
-                        html.write('\n</tr>')
-                html.write('\n</tbody>')
-                html.write('\n</table>')
+        if first_row is not None: #aka more rows than just header
+            html.write(''.join(html_parts))
+            # rows are sorted by hash, so each group of matching files is contiguous
+            for hash_value, group in groupby((row for row in rows if row), key=itemgetter(4)):
+                # for each hash, print header, file info, and list of matching files
+                html.write('\n<p>Files matching checksum <strong>%s</strong>:</p>'
+                    '\n<table class="table table-sm table-responsive table-bordered table-hover">'
+                    '\n<thead>'
+                    '\n<tr>'
+                    '\n<th>Filename</th><th>Filesize</th>'
+                    '<th>Date modified</th><th>Errors</th>'
+                    '<th>Checksum</th><th>Namespace</th>'
+                    '<th>ID</th><th>Format</th>'
+                    '<th>Format version</th><th>MIME type</th>'
+                    '<th>Basis for ID</th><th>Warning</th>'
+                    '\n</tr>'
+                    '\n</thead>'
+                    '\n<tbody>' % escape(hash_value, False))
+                write_html_rows(group, html)
+                html.write('\n</tbody>\n</table>')
         else:
-            html.write('\nNone found.\n<br><br>')
+            html_parts.append('\nNone found.\n<br><br>')
+            html.write(''.join(html_parts))
 
     # otherwise write as normal
     else:
-        if numline > 1: #aka more rows than just header
+        if first_row is not None: #aka more rows than just header
             # add borders to table for full-width tables only
             full_width_table_headers = ['Unidentified', 'Warnings', 'Errors']
             if header in full_width_table_headers:
-                html.write('\n<table class="table table-sm table-responsive table-bordered table-hover">')
+                html_parts.append('\n<table class="table table-sm table-responsive table-bordered table-hover">')
             else:
-                html.write('\n<table class="table table-sm table-responsive table-hover">')
+                html_parts.append('\n<table class="table table-sm table-responsive table-hover">')
             # write header row
-            html.write('\n<thead>')
-            html.write('\n<tr>')
-            row1 = next(r)
-            for column in row1:
-                html.write('\n<th>' + column + '</th>')
-            html.write('\n</tr>')
-            html.write('\n</thead>')
+            html_parts.append('\n<thead>\n<tr>')
+            html_parts.extend(['\n<th>' + escape(column, False) + '</th>' for column in header_rows[0]])
+            html_parts.append('\n</tr>\n</thead>\n<tbody>')
+            html.write(''.join(html_parts))
             # write data rows
-            html.write('\n<tbody>')
-            for row in r:
-                # write data
-                html.write('\n<tr>')
-                for column in row:
-                    html.write('\n<td>' + column + '</td>')
-                html.write('\n</tr>')
-            html.write('\n</tbody>')
-            html.write('\n</table>')
+            write_html_rows(rows, html)
+            html.write('\n</tbody>\n</table>')
         else:
-            html.write('\nNone found.\n<br><br>')
+            html_parts.append('\nNone found.\n<br><br>')
+            html.write(''.join(html_parts))
     
     in_file.close()
 
+def write_html_rows(rows, html):
+    """Write rows of column values to html table body, escaped and in batches"""
+    batch = []
+    for row in rows:
+        batch.append('\n<tr>' + ''.join(['\n<td>%s</td>' % escape(column, False) for column in row]) + '\n</tr>')
+        if len(batch) >= HTML_ROW_BATCH_SIZE:
+            html.writelines(batch)
+            batch = []
+    html.writelines(batch)
+
 def close_html(html):
     """Add JavaScript and write html closing tags"""
-    html.write('\n</div>')
-    html.write('\n</div>')
-    html.write('\n</div>')
-    html.write('\n</div>')
-    html.write('\n<script src="./.assets/js/jquery-3.3.1.slim.min.js"></script>')
-    html.write('\n<script src="./.assets/js/popper.min.js"></script>')
-    html.write('\n<script src="./.assets/js/bootstrap.min.js"></script>')
-    html.write('\n<script>$(".navbar-nav .nav-link").on("click", function(){ $(".navbar-nav").find(".active").removeClass("active"); $(this).addClass("active"); });</script>')
-    html.write('\n<script>$(".navbar-brand").on("click", function(){ $(".navbar-nav").find(".active").removeClass("active"); });</script>')
-    html.write('\n</body>')
-    html.write('\n</html>')
-
-def make_tree(source_dir):
+    html.write('\n</div>'
+        '\n</div>'
+        '\n</div>'
+        '\n</div>'
+        '\n<script src="./.assets/js/jquery-3.3.1.slim.min.js"></script>'
+        '\n<script src="./.assets/js/popper.min.js"></script>'
+        '\n<script src="./.assets/js/bootstrap.min.js"></script>'
+        '\n<script>$(".navbar-nav .nav-link").on("click", function(){ $(".navbar-nav").find(".active").removeClass("active"); $(this).addClass("active"); });</script>'
+        '\n<script>$(".navbar-brand").on("click", function(){ $(".navbar-nav").find(".active").removeClass("active"); });</script>'
+        '\n</body>'
+        '\n</html>')
+
+def make_tree(ctx, source_dir):
     """Call tree on source directory and save output to tree.txt"""
-    tree_command = 'tree -tDhR "%s" > "%s"' % (source_dir, os.path.join(report_dir, 'tree.txt'))
-    subprocess.call(tree_command, shell=True)
+    with open(os.path.join(ctx.report_dir, 'tree.txt'), 'wb') as tree_out:
+        try:
+            subprocess.run(['tree', '-tDhR', source_dir], stdout=tree_out, close_fds=False, check=False)
+        except OSError as e:
+            log.error("\nERROR: Unable to run tree. Detailed output: %s", e)
 
-def process_content(args, source_dir, cursor, conn, html, brunnhilde_version, siegfried_version, use_hash, ssn_mode):
+def process_content(args, ctx, source_dir, cursor, conn, html, brunnhilde_version, siegfried_version, use_hash, ssn_mode):
     """Run through main processing flow on specified directory"""
     scan_started = str(datetime.datetime.now()) # get time
-    run_siegfried(args, source_dir, use_hash) # run siegfried
-    import_csv(cursor, conn, use_hash) # load csv into sqlite db
-    get_stats(args, source_dir, scan_started, cursor, html, brunnhilde_version, siegfried_version, use_hash) # get aggregate stats and write to html file
-    generate_reports(args, cursor, html, use_hash) # run sql queries, print to html and csv
-    if args.bulkextractor == True: # bulk extractor option is chosen
-        if not sys.platform.startswith('win'): # skip in Windows
-            run_bulkext(source_dir, ssn_mode)
-            write_html('SSNs', '%s' % os.path.join(bulkext_dir, 'pii.txt'), '\t', html)
-        else:
-            print("\nBulk Extractor not supported on Windows. Skipping.")
+    # clamav, siegfried, and bulk extractor each read source independently, so run them
+    # alongside each other; with --jobs 1 they run one after another in this order
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        clamav = None
+        if args.noclam == False: # run clamAV virus check unless specified otherwise
+            # skip clamav on Windows
+            if not IS_WINDOWS:
+                clamav = executor.submit(run_clamav, args, ctx, source_dir)
+        siegfried = executor.submit(run_siegfried, args, ctx, source_dir, use_hash) # run siegfried
+        bulkext = None
+        if args.bulkextractor == True: # bulk extractor option is chosen
+            if not IS_WINDOWS: # skip in Windows
+                bulkext = executor.submit(run_bulkext, ctx, source_dir, ssn_mode)
+            else:
+                log.warning("\nBulk Extractor not supported on Windows. Skipping.")
+        siegfried.result()
+        import_csv(cursor, conn, ctx.sf_file, use_hash) # load csv into sqlite db
+        if clamav is not None: # virus log is read into the html by get_stats
+            clamav.result()
+        get_stats(args, ctx, scan_started, cursor, html, brunnhilde_version, siegfried_version, use_hash) # get aggregate stats and write to html file
+        generate_reports(args, ctx, cursor, html, use_hash) # run sql queries, print to html and csv
+        if bulkext is not None:
+            bulkext.result()
+            pii_file = os.path.join(ctx.bulkext_dir, 'pii.txt')
+            if os.path.isfile(pii_file): # missing if bulk extractor couldn't run
+                write_html('SSNs', pii_file, '\t', html)
     close_html(html) # close HTML file tags
-    if not sys.platform.startswith('win'):
-        make_tree(source_dir) # create tree.txt on mac and linux machines
+    if not IS_WINDOWS:
+        make_tree(ctx, source_dir) # create tree.txt on mac and linux machines
+
+def make_carve_dir(args, ctx):
+    """Create and return dir for files exported from disk image
+
+    Files that --removefiles will delete anyway are exported to /dev/shm when it is
+    available, the image is no larger than --tmp_file_max_memory_size, and /dev/shm
+    has room for twice the image.
+    """
+    if args.removefiles == True and os.path.isdir(SHM_DIR) and os.access(SHM_DIR, os.W_OK):
+        image_size = os.path.getsize(ctx.source)
+        # deleted files recovered with tsk_recover -e can add up to more than the image
+        # itself, so leave headroom rather than fill /dev/shm and fail the carve
+        if image_size <= args.tmp_file_max_memory_size * 1024 * 1024 and image_size * 2 <= shutil.disk_usage(SHM_DIR).free:
+            tempdir = tempfile.mkdtemp(prefix='brunnhilde-carved-', dir=SHM_DIR)
+            # never leave carved files in memory, even if processing fails
+            atexit.register(shutil.rmtree, tempdir, ignore_errors=True)
+            return tempdir
+    tempdir = os.path.join(ctx.report_dir, 'carved_files')
+    try:
+        os.makedirs(tempdir)
+    except OSError as exception:
+        if exception.errno != errno.EEXIST:
+            raise
+    return tempdir
 
-def write_pronom_links(old_file, new_file):
-    """Use regex to replace fmt/# and x-fmt/# PUIDs with link to appropriate PRONOM page"""
-    
-    if (sys.version_info > (3, 0)):
-        in_file = open(old_file, 'r', encoding='utf8')
-        out_file = open(new_file, 'w', encoding='utf8')
-    else:
-        in_file = open(old_file, 'rb')
-        out_file = open(new_file, 'wb')
-
-    for line in in_file:
-        regex = r"fmt\/[0-9]+|x\-fmt\/[0-9]+" #regex to match fmt/# or x-fmt/#
-        pronom_links_to_replace = re.findall(regex, line)
-        new_line = line
-        for match in pronom_links_to_replace:
-            new_line = line.replace(match, "<a href=\"http://nationalarchives.gov.uk/PRONOM/" + 
-                    match + "\" target=\"_blank\">" + match + "</a>")
-            line = new_line # allow for more than one match per line
-        out_file.write(new_line)
+def remove_dir_in_background(path):
+    """Move directory aside and delete it in a background thread
 
-    in_file.close()
-    out_file.close()
+    The directory is renamed first so it disappears from the reports dir at once;
+    the process waits for the deletion to finish before exiting.
+    """
+    trash = '%s.trash-%d' % (path, os.getpid())
+    os.rename(path, trash)
+    remover = threading.Thread(target=shutil.rmtree, args=(trash,), kwargs={'ignore_errors': True})
+    remover.start()
+    atexit.register(remover.join)
 
 def download_asset_file(asset_url, asset_filepath):
     """Download file from asset_url and write to asset_filepath"""
@@ -608,11 +784,30 @@ def download_asset_file(asset_url, asset_filepath):
     with open(asset_filepath, "wb") as f:
         f.write(r.content)
 
-def close_files_conns_on_exit(html, conn, cursor, report_dir):
+def _abort(msg, html, conn, cursor, report_dir):
+    """Log msg, close report and db handles, remove report dir, and exit"""
+    log.error(msg)
     cursor.close()
     conn.close()
     html.close()
-    shutil.rmtree(report_dir)
+    # errors while cleaning up must not hide the failure that got us here
+    shutil.rmtree(report_dir, ignore_errors=True)
+    sys.exit(1)
+
+def _validate_source(args):
+    """Exit before any output is created if source does not match the input type"""
+    source = os.path.abspath(args.source)
+    if args.diskimage == True:
+        # throw error message and exit if run in Windows
+        if IS_WINDOWS:
+            log.error("\nDisk images not supported as inputs in Windows. Ending process.")
+            sys.exit(2)
+        if not os.path.isfile(source):
+            log.error("\nSource is not a file. Disk images must be passed as a single image file.")
+            sys.exit(2)
+    elif not os.path.isdir(source):
+        log.error("\nSource is not a Directory. If you're processing a disk image, place '-d' before source.")
+        sys.exit(2)
 
 def _make_parser(version):
     parser = argparse.ArgumentParser()
@@ -626,10 +821,12 @@ def _make_parser(version):
     parser.add_argument("--tsk_fstype", help="Specify file system type for tsk_recover. See tsk_recover man page for details", action="store")
     parser.add_argument("--tsk_sector_offset", help="Sector offset for particular volume for tsk_recover to recover", action="store")
     parser.add_argument("--hash", help="Specify hash algorithm", dest="hash", action="store", type=str)
+    parser.add_argument("-j", "--jobs", help="Number of scanners (ClamAV, Siegfried, Bulk Extractor) to run at once (default: 3)", action="store", type=int, default=3)
     parser.add_argument("-k", "--keepsqlite", help="Retain Brunnhilde-generated sqlite db after processing", action="store_true")
     parser.add_argument("-l", "--largefiles", help="Enable virus scanning of large files", action="store_true")
     parser.add_argument("-n", "--noclam", help="Skip ClamScan Virus Check", action="store_true")
     parser.add_argument("-r", "--removefiles", help="Delete 'carved_files' directory when done (disk image input only)", action="store_true")
+    parser.add_argument("--tmp_file_max_memory_size", help="Largest disk image, in MB, to export to memory (/dev/shm) instead of 'carved_files' when --removefiles is set; 0 to disable (default: 512)", action="store", type=int, default=512)
     parser.add_argument("-t", "--throttle", help="Pause for 1s between Siegfried scans", action="store_true")
     parser.add_argument("-v", "--verbosesf", help="Log verbose Siegfried output to terminal while processing", action="store_true")
     parser.add_argument("-V", "--version", help="Display Brunnhilde version", action="version", version="%s" % version)
@@ -644,23 +841,27 @@ def _make_parser(version):
     return parser
 
 def main():
+    # status messages go to stdout, as plain lines
+    logging.basicConfig(stream=sys.stdout, format='%(message)s', level=logging.INFO)
+
     # system info
     brunnhilde_version = 'brunnhilde 1.8.1'
     siegfried_version = subprocess.check_output(["sf", "-version"]).decode()
 
     parser = _make_parser(brunnhilde_version)
     args = parser.parse_args()
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    _validate_source(args)
 
-    # global variables
-    global source, destination, basename, report_dir, csv_dir, log_dir, bulkext_dir, sf_file, ssn_mode
-    source = os.path.abspath(args.source)
-    destination = os.path.abspath(args.destination)
-    basename = args.basename
-    report_dir = os.path.join(destination, '%s' % basename)
-    csv_dir = os.path.join(report_dir, 'csv_reports')
-    log_dir = os.path.join(report_dir, 'logs')
-    bulkext_dir = os.path.join(report_dir, 'bulk_extractor')
-    sf_file = os.path.join(report_dir, 'siegfried.csv')
+    # default to sha256 on CPUs with SHA extensions, where it hashes as fast as md5
+    if args.hash is None and cpu_has_sha_extensions():
+        args.hash = 'sha256'
+
+    # paths for this run
+    ctx = Context(os.path.abspath(args.source), os.path.abspath(args.destination), args.basename)
+    source = ctx.source
+    report_dir = ctx.report_dir
 
     # check to see if hash specified is 'none'
     use_hash = True
@@ -682,7 +883,7 @@ def main():
         
     # create subdirectory for CSV reports
     try:
-        os.makedirs(csv_dir)
+        os.makedirs(ctx.csv_dir)
     except OSError as exception:
         if exception.errno != errno.EEXIST:
             raise
@@ -692,7 +893,7 @@ def main():
         pass
     else:
         try:
-            os.makedirs(log_dir)
+            os.makedirs(ctx.log_dir)
         except OSError as exception:
             if exception.errno != errno.EEXIST:
                 raise
@@ -715,9 +916,9 @@ def main():
         # copy
         try:
             shutil.copytree(src, assets_target)
-            print('\nAssets successfully copied to destination from "%s".' % (os.path.abspath(args.load_assets)))
+            log.info('\nAssets successfully copied to destination from "%s".', os.path.abspath(args.load_assets))
         except (shutil.Error, OSError) as e:
-            print("\nERROR: Unable to copy assets from --load_assets path. Detailed output: %s" % (e))
+            log.error("\nERROR: Unable to copy assets from --load_assets path. Detailed output: %s", e)
             sys.exit(1)
 
     # otherwise, download from github
@@ -740,13 +941,13 @@ def main():
                 'url': 'https://github.com/tw4l/brunnhilde/blob/master/assets/js/popper.min.js'
             }
         ]
-        print("\nDownloading CSS and JS files from Github...")
+        log.info("\nDownloading CSS and JS files from Github...")
         try:
             for a in assets_to_download:
                 download_asset_file(a['url'], a['filepath'])
-            print("\nDownloads complete.")
+            log.info("\nDownloads complete.")
         except Exception:
-            print("\nERROR: Unable to download required CSS and JS files. Please ensure your internet connection is working and try again.")
+            log.error("\nERROR: Unable to download required CSS and JS files. Please ensure your internet connection is working and try again.")
             sys.exit(1)
 
         # save a copy locally if option is selected by user
@@ -759,39 +960,29 @@ def main():
             # copy
             try:
                 shutil.copytree(assets_target, new_dir)
-                print('\nBrunnhilde assets saved locally. To use these in subsequent runs, use this argument: --load_assets "%s"' % (user_path))
+                log.info('\nBrunnhilde assets saved locally. To use these in subsequent runs, use this argument: --load_assets "%s"', user_path)
             except shutil.Error as e:
-                print("\nERROR: Unable to copy assets to --save_assets path. Detailed output: %s" % (e))         
+                log.error("\nERROR: Unable to copy assets to --save_assets path. Detailed output: %s", e)
 
-    # create html report
-    temp_html = os.path.join(report_dir, 'temp.html')
-    if (sys.version_info > (3, 0)):
-        html = open(temp_html, 'w', encoding='utf8')
-    else:
-        html = open(temp_html, 'wb')
+    # create html report, with hrefs for PRONOM IDs
+    html = PronomLinkWriter(os.path.join(report_dir, 'report.html'))
 
     # open sqlite db
     db = os.path.join(report_dir, 'siegfried.sqlite')
     conn = sqlite3.connect(db)
     conn.text_factory = str  # allows utf-8 data to be stored
     cursor = conn.cursor()
+    # db is a disposable report artifact, so skip journaling and fsyncs
+    cursor.execute("PRAGMA journal_mode=MEMORY")
+    cursor.execute("PRAGMA synchronous=OFF")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-131072") # 128 MB page cache
 
     # characterize source
     if args.diskimage == True: # source is a disk image
-        
-        # throw error message and exit if run in Windows
-        if sys.platform.startswith('win'):
-            print("\nDisk images not supported as inputs in Windows. Ending process.")
-            close_files_conns_on_exit(html, conn, cursor, report_dir)
-            sys.exit(1)
 
         # make tempdir
-        tempdir = os.path.join(report_dir, 'carved_files')
-        try:
-            os.makedirs(tempdir)
-        except OSError as exception:
-            if exception.errno != errno.EEXIST:
-                raise
+        tempdir = make_carve_dir(args, ctx)
 
         # export disk image contents to tempdir
         if args.hfs == True: # hfs disks
@@ -805,85 +996,76 @@ def main():
                     carvefiles = 'bash /usr/local/share/hfsexplorer/bin/unhfs -v -resforks APPLEDOUBLE -o "%s" "%s"' % (tempdir, source)
                 else:
                     carvefiles = 'bash /usr/local/share/hfsexplorer/bin/unhfs -v -o "%s" "%s"' % (tempdir, source)
-            print("\nAttempting to carve files from disk image using HFS Explorer.")
+            log.info("\nAttempting to carve files from disk image using HFS Explorer.")
             try:
-                subprocess.call(carvefiles, shell=True)
-                print("\nFile carving successful.")
+                subprocess.check_call(carvefiles, shell=True)
+                log.info("\nFile carving successful.")
             except subprocess.CalledProcessError as e:
-                print(e.output)
-                print("\nBrunnhilde was unable to export files from disk image. Ending process.")
-                close_files_conns_on_exit(html, conn, cursor, report_dir)
-                sys.exit(1)
+                log.error("\nERROR: %s", e)
+                _abort("\nBrunnhilde was unable to export files from disk image. Ending process.", html, conn, cursor, report_dir)
 
         else: # non-hfs disks (note: no UDF support yet)
-            print("\nAttempting to carve files from disk image using tsk_recover.")
+            log.info("\nAttempting to carve files from disk image using tsk_recover.")
             # recover allocated or all files depending on user input
             if args.allocated == True:
-                carvefiles = ['tsk_recover', '-a', source, tempdir]
+                carvefiles = ['tsk_recover', '-a']
             else:
-                carvefiles = ['tsk_recover', '-e', source, tempdir]
+                carvefiles = ['tsk_recover', '-e']
 
-            # add optional user-supplied inputs at appropriate list indices
+            # add optional user-supplied inputs before the image and output paths
             if args.tsk_fstype:
-                carvefiles.insert(2, '-f')
-                carvefiles.insert(3, args.tsk_fstype)
+                carvefiles.extend(['-f', args.tsk_fstype])
             if args.tsk_imgtype:
-                carvefiles.insert(2, '-i')
-                carvefiles.insert(3, args.tsk_imgtype)
+                carvefiles.extend(['-i', args.tsk_imgtype])
             if args.tsk_sector_offset:
-                carvefiles.insert(2, '-o')
-                carvefiles.insert(3, args.tsk_sector_offset)
+                carvefiles.extend(['-o', args.tsk_sector_offset])
+            carvefiles.extend([source, tempdir])
 
-            # call command
-            try:
-                subprocess.check_output(carvefiles)
-                print("\nFile carving successful.")
-            except subprocess.CalledProcessError as e:
-                print(e.output)
-                print("\nBrunnhilde was unable to export files from disk image. Ending process.")
-                close_files_conns_on_exit(html, conn, cursor, report_dir)
-                sys.exit(1)
-
-            # generate DFXML with fiwalk
-            print("\nAttempting to generate DFXML file from disk image using fiwalk.")
+            # generate DFXML with fiwalk while tsk_recover runs, since both only read the image
+            log.info("\nAttempting to generate DFXML file from disk image using fiwalk.")
             fiwalk_file = os.path.join(report_dir, 'dfxml.xml')
+
+            # call commands; fiwalk's stderr goes to a temp file, since nothing reads
+            # it until tsk_recover is done and a full pipe would stall fiwalk
+            carve = subprocess.Popen(carvefiles, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            fiwalk_stderr = tempfile.TemporaryFile()
             try:
-                subprocess.check_output(['fiwalk', '-X', fiwalk_file, source])
-                print("\nDFXML file created.")
-            except subprocess.CalledProcessError as e:
-                print('\nERROR: Fiwalk could not create DFXML for disk. STDERR: %s' % (e.output))
+                fiwalk = subprocess.Popen(['fiwalk', '-X', fiwalk_file, source], stdout=subprocess.DEVNULL, stderr=fiwalk_stderr)
+            except OSError as e:
+                fiwalk = None
+                log.error("\nERROR: Unable to run fiwalk. Detailed output: %s", e)
+            carve_stderr = carve.communicate()[1]
+            if carve.returncode != 0:
+                # stop fiwalk before removing the report dir it writes into
+                if fiwalk is not None:
+                    fiwalk.kill()
+                    fiwalk.wait()
+                fiwalk_stderr.close()
+                log.error(carve_stderr.decode('utf8', 'replace'))
+                _abort("\nBrunnhilde was unable to export files from disk image. Ending process.", html, conn, cursor, report_dir)
+            log.info("\nFile carving successful.")
+            if fiwalk is not None:
+                fiwalk.wait()
+                if fiwalk.returncode == 0:
+                    log.info("\nDFXML file created.")
+                else:
+                    fiwalk_stderr.seek(0)
+                    log.error('\nERROR: Fiwalk could not create DFXML for disk. STDERR: %s', fiwalk_stderr.read().decode('utf8', 'replace'))
+            fiwalk_stderr.close()
 
 
         # process tempdir
-        if args.noclam == False: # run clamAV virus check unless specified otherwise
-            # skip clamav on Windows
-            if not sys.platform.startswith('win'):
-                run_clamav(args, tempdir)
-        process_content(args, tempdir, cursor, conn, html, brunnhilde_version, siegfried_version, use_hash, ssn_mode)
+        process_content(args, ctx, tempdir, cursor, conn, html, brunnhilde_version, siegfried_version, use_hash, ssn_mode)
         if args.removefiles == True:
-            shutil.rmtree(tempdir)
+            remove_dir_in_background(tempdir)
 
 
     else: #source is a directory
-        if os.path.isdir(source) == False:
-            print("\nSource is not a Directory. If you're processing a disk image, place '-d' before source.")
-            sys.exit()
-        if args.noclam == False: # run clamAV virus check unless specified otherwise
-            # skip clamav on Windows
-            if not sys.platform.startswith('win'):
-                run_clamav(args, source)
-        process_content(args, source, cursor, conn, html, brunnhilde_version, siegfried_version, use_hash, ssn_mode)
+        process_content(args, ctx, source, cursor, conn, html, brunnhilde_version, siegfried_version, use_hash, ssn_mode)
 
     # close HTML file
     html.close()
 
-    # write new html file, with hrefs for PRONOM IDs
-    new_html = os.path.join(report_dir, 'report.html')
-    write_pronom_links(temp_html, new_html)
-
-    # remove temp html file
-    os.remove(temp_html)
-
     # remove sqlite db unless user selected to retain
     if not args.keepsqlite:
         os.remove(os.path.join(report_dir, 'siegfried.sqlite'))
@@ -892,7 +1074,7 @@ def main():
     cursor.close()
     conn.close()
 
-    print("\nBrunnhilde characterization complete. Reports in %s." % report_dir)
+    log.info("\nBrunnhilde characterization complete. Reports in %s.", report_dir)
 
 if __name__ == '__main__':
     main()
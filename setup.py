@@ -12,6 +12,7 @@ setup(
     keywords = 'archives reporting characterization identification diskimages',
     platforms = ['POSIX', 'Windows'],
     install_requires=['requests'],
+    python_requires='>=3.5',
     test_suite='test',
     classifiers = [
         'Development Status :: 5 - Production/Stable',
@@ -23,7 +24,6 @@ setup(
         'Operating System :: MacOS :: MacOS X',
         'Operating System :: POSIX :: Linux',
         'Operating System :: Microsoft :: Windows',
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3.5',
         'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
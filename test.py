@@ -1,17 +1,19 @@
 # encoding: utf-8
 
-from __future__ import (print_function, unicode_literals)
-
 import datetime
+import io
 import logging
 import os
 import shutil
+import sqlite3
 import subprocess
 import sys
 import tempfile
 import unittest
 from os.path import join as j
 
+import brunnhilde
+
 
 logging.basicConfig(filename='test.log', level=logging.DEBUG)
 stderr = logging.StreamHandler()
@@ -165,6 +167,39 @@ class TestBrunnhildeIntegration(SelfCleaningTestCase):
         with open(virus_log, 'r') as f:
             self.assertTrue("Infected files: 0" in f.read())
 
+    def test_integration_outputs_created_serial_jobs(self):
+        subprocess.call('python brunnhilde.py -j 1 ./test-data/files/ "%s" test' % (self.dest_tmpdir), 
+            shell=True)
+        # html report
+        self.assertTrue(is_non_zero_file(j(self.dest_tmpdir, 'test', 
+            'report.html')))
+        # virus log correctly written
+        virus_log = j(self.dest_tmpdir, 'test', 'logs', 'viruscheck-log.txt')
+        with open(virus_log, 'r') as f:
+            self.assertTrue("Infected files: 0" in f.read())
+
+    def test_integration_invalid_source_no_outputs(self):
+        subprocess.call('python brunnhilde.py -n ./test-data/does-not-exist/ "%s" test' % (self.dest_tmpdir), 
+            shell=True)
+        # nothing written for a source that is not a directory
+        self.assertFalse(os.path.exists(j(self.dest_tmpdir, 'test')))
+
+    def test_integration_missing_scanners(self):
+        # PATH with only sf and python, so clamscan and bulk_extractor can't be found
+        bin_dir = j(self.dest_tmpdir, 'bin')
+        os.makedirs(bin_dir)
+        os.symlink(shutil.which('sf'), j(bin_dir, 'sf'))
+        os.symlink(sys.executable, j(bin_dir, 'python'))
+        env = dict(os.environ, PATH=bin_dir)
+        returncode = subprocess.call('python brunnhilde.py -b ./test-data/files/ "%s" test' % (self.dest_tmpdir), 
+            shell=True, env=env)
+        self.assertEqual(returncode, 0)
+        # report still completed
+        with open(j(self.dest_tmpdir, 'test', 'report.html'), 'r') as f:
+            self.assertTrue('</html>' in f.read())
+        self.assertFalse(os.path.isfile(j(self.dest_tmpdir, 'test', 
+            'siegfried.sqlite')))
+
     def test_integration_retain_sqlite_db(self):
         subprocess.call('python brunnhilde.py -k ./test-data/files/ "%s" test' % (self.dest_tmpdir), 
             shell=True)
@@ -191,5 +226,78 @@ class TestBrunnhildeIntegration(SelfCleaningTestCase):
             '.assets', 'js', 'popper.min.js')))
 
 
+class TestBrunnhildeUnit(SelfCleaningTestCase):
+    """
+    Unit tests. These call Brunnhilde functions directly and don't need sf installed.
+    """
+
+    def write_sf_csv(self, rows):
+        sf_file = j(self.dest_tmpdir, 'siegfried.csv')
+        with open(sf_file, 'w') as f:
+            f.write('filename,filesize,modified,errors,namespace,id,format,version,mime,basis,warning\n')
+            for row in rows:
+                f.write(row + '\n')
+        return sf_file
+
+    def load_with(self, loader):
+        sf_file = j(self.dest_tmpdir, 'siegfried.csv')
+        with open(sf_file, 'w') as f:
+            f.write('filename,filesize,modified,errors,md5,namespace,id,format,version,mime,basis,warning\n')
+            f.write('/src/a.txt,5,2018-01-01,,5d41402abc4b2a76b9719d911017c592,pronom,x-fmt/111,Plain Text File,,text/plain,extension match,\n')
+            # short row and row with an extra field are skipped
+            f.write('/src/short.txt,5,2018-01-01\n')
+            f.write('/src/long.txt,5,2018-01-01,,5d41402abc4b2a76b9719d911017c592,pronom,x-fmt/111,Plain Text File,,text/plain,,,extra\n')
+            f.write('"/src/b, c.pdf",0,2018-01-02,empty source,d41d8cd98f00b204e9800998ecf8427e,pronom,UNKNOWN,,,,,no match\n')
+        conn = sqlite3.connect(':memory:')
+        cursor = conn.cursor()
+        brunnhilde.create_table(cursor, True)
+        if loader(cursor, sf_file, True) == False:
+            conn.close()
+            self.skipTest('%s not available' % loader.__name__)
+        rows = cursor.execute('SELECT * FROM siegfried ORDER BY filename').fetchall()
+        conn.close()
+        return rows
+
+    def test_load_csv_python(self):
+        rows = self.load_with(brunnhilde.load_csv_python)
+        self.assertEqual(rows, [
+            ('/src/a.txt', '5', '2018-01-01', '', bytes.fromhex('5d41402abc4b2a76b9719d911017c592'), 'pronom', 'x-fmt/111', 'Plain Text File', '', 'text/plain', 'extension match', ''),
+            ('/src/b, c.pdf', '0', '2018-01-02', 'empty source', bytes.fromhex('d41d8cd98f00b204e9800998ecf8427e'), 'pronom', 'UNKNOWN', '', '', '', '', 'no match'),
+        ])
+
+    def test_load_csv_arrow(self):
+        self.assertEqual(self.load_with(brunnhilde.load_csv_arrow), self.load_with(brunnhilde.load_csv_python))
+
+    @unittest.skipIf(brunnhilde.pyarrow is None, 'pyarrow not installed')
+    def test_load_csv_arrow_header_mismatch(self):
+        sf_file = self.write_sf_csv(['/src/a.txt,5,2018-01-01,,pronom,x-fmt/111,Plain Text File,,text/plain,,'])
+        conn = sqlite3.connect(':memory:')
+        cursor = conn.cursor()
+        # table has a hash column the csv doesn't, so leave it to the csv module loader
+        brunnhilde.create_table(cursor, True)
+        self.assertFalse(brunnhilde.load_csv_arrow(cursor, sf_file, True))
+        conn.close()
+
+    def test_load_csv_vtab(self):
+        self.assertEqual(self.load_with(brunnhilde.load_csv_vtab), self.load_with(brunnhilde.load_csv_python))
+
+    def test_total_size_scanarchives(self):
+        sf_file = self.write_sf_csv([
+            '/src/a.zip,1000,2018-01-01,,pronom,x-fmt/263,ZIP Format,,application/zip,,',
+            '/src/a.zip#member.txt,800,2018-01-01,,pronom,x-fmt/111,Plain Text File,,text/plain,,',
+            '/src/Invoice #3.pdf,24,2018-01-01,,pronom,fmt/18,Acrobat PDF,1.4,application/pdf,,',
+        ])
+        conn = sqlite3.connect(':memory:')
+        cursor = conn.cursor()
+        brunnhilde.import_csv(cursor, conn, sf_file, False)
+        args = brunnhilde._make_parser('test').parse_args(['-n', '-z', '/src', self.dest_tmpdir, 'test'])
+        ctx = brunnhilde.Context('/src', self.dest_tmpdir, 'test')
+        html = io.StringIO()
+        brunnhilde.get_stats(args, ctx, 'now', cursor, html, 'brunnhilde', 'sf', False)
+        # archive member is left out, file with '#' in its name is not
+        self.assertTrue('<strong>Total size:</strong> 1 KB' in html.getvalue())
+        conn.close()
+
+
 if __name__ == '__main__':
     unittest.main()